@@ -1,100 +1,336 @@
-from google.adk.agents import LlmAgent, SequentialAgent
+import asyncio
+import atexit
+import functools
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncGenerator, Callable, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.events import Event, EventActions
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.sessions.state import State
 import google.auth
-from google.adk.tools.bigquery import BigQueryCredentialsConfig
-from google.adk.tools.bigquery import BigQueryToolset
-from google.adk.tools.bigquery.config import BigQueryToolConfig
-from google.adk.tools.bigquery.config import WriteMode
+import google.auth.credentials
+from google.cloud import bigquery
+from google import genai
 from google.genai import types
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
 
 CLOUD_PROJECT_ID = "cr-ai-nov-2025"
 DEFAULT_DATASET_ID = "retail_db"
-read_tool_config = BigQueryToolConfig(
-    write_mode=WriteMode.BLOCKED,
 
-)
-write_tool_config = BigQueryToolConfig(
-    write_mode=WriteMode.ALLOWED,
-)
 
-application_default_credentials, _ = google.auth.default()
-credentials_config = BigQueryCredentialsConfig(
-    credentials=application_default_credentials
-)
+# Credentials and the BigQuery client are created once per process on first
+# use and shared by every agent, so ADC discovery runs once and all queries
+# and inserts reuse the same HTTP connection pool.
+@functools.lru_cache(maxsize=1)
+def get_credentials() -> google.auth.credentials.Credentials:
+    credentials, _ = google.auth.default()
+    return credentials
 
-bigquery_read_toolset = BigQueryToolset(
-    credentials_config=credentials_config, bigquery_tool_config=read_tool_config
-)
-bigquery_write_toolset = BigQueryToolset(
-    credentials_config=credentials_config, bigquery_tool_config=write_tool_config
-)
 
-# --- 2. Individual Specialized Agents (LlmAgent) ---
-# ... (DataFinder, CMOAgent, CFOAgent, OpsAgent, CEOAgent remain the same) ...
+@functools.lru_cache(maxsize=1)
+def get_bigquery_client() -> bigquery.Client:
+    return bigquery.Client(project=CLOUD_PROJECT_ID, credentials=get_credentials())
+
+
+# --- 2. Individual Specialized Agents ---
+
+
+def _parse_json_output(text) -> Optional[Any]:
+    """Parses an agent's JSON output, tolerating markdown code fences."""
+    if not isinstance(text, str):
+        return text
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        return None
+
+
+# The schema and query shape are fixed, so DataFinder runs this query directly
+# instead of asking Gemini to write it.
+UNDERCUT_SIGNALS_SQL = f"""
+    SELECT p.product_id, p.name, p.cost_price, m.competitor_name, m.detected_price
+    FROM `{CLOUD_PROJECT_ID}.{DEFAULT_DATASET_ID}.products` AS p
+    JOIN `{CLOUD_PROJECT_ID}.{DEFAULT_DATASET_ID}.market_signals` AS m
+      ON m.product_id = p.product_id
+    WHERE m.detected_price < p.cost_price
+      AND m.signal_timestamp > @since
+    ORDER BY p.product_id, m.detected_price
+"""
+SIGNAL_LOOKBACK = timedelta(hours=24)
+
+# DataFinder runs the same query every time, so its output is cached per hour
+# and served straight from memory, skipping BigQuery entirely. The cache lives
+# in each worker process; other workers and instances query on their own first
+# run of the hour.
+UNDERCUT_CACHE_TTL_SECONDS = 3600
+_undercut_signals_cache: dict[str, tuple[float, str]] = {}
+
 
-data_finder = LlmAgent(
+def _undercut_cache_key() -> str:
+    # The hourly bucket makes the signals refresh at least once per hour.
+    date_bucket = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+    return hashlib.sha256((UNDERCUT_SIGNALS_SQL + date_bucket).encode()).hexdigest()
+
+
+def _signals_summary(signals: str) -> types.Content:
+    # The signals themselves travel only through state: event content is
+    # replayed into later LLM requests, which would bill them a second time
+    # next to the cached copy.
+    parsed = _parse_json_output(signals)
+    count = len(parsed) if isinstance(parsed, list) else "?"
+    return types.Content(
+        role="model", parts=[types.Part(text=f"Found {count} undercut signal(s).")]
+    )
+
+
+def _serve_cached_signals(callback_context: CallbackContext) -> Optional[types.Content]:
+    cached = _undercut_signals_cache.get(_undercut_cache_key())
+    if cached is None or cached[0] < time.monotonic():
+        return None
+    callback_context.state["undercut_signals"] = cached[1]
+    # Returning content skips the agent run entirely.
+    return _signals_summary(cached[1])
+
+
+def _store_signals(callback_context: CallbackContext) -> Optional[types.Content]:
+    signals = callback_context.state.get("undercut_signals")
+    if signals is not None:
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in _undercut_signals_cache.items() if expires_at < now]:
+            del _undercut_signals_cache[key]
+        _undercut_signals_cache[_undercut_cache_key()] = (now + UNDERCUT_CACHE_TTL_SECONDS, signals)
+    return None
+
+
+def fetch_undercut_signals() -> list[dict]:
+    """Returns recent competitor prices that are below our cost price.
+
+    Returns:
+        One dict per signal with product_id, name, cost_price,
+        competitor_name and detected_price.
+    """
+    # Truncating the lookback to the hour keeps the query parameters stable
+    # within an hour, so repeat runs are served from BigQuery's result cache.
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("since", "TIMESTAMP", now - SIGNAL_LOOKBACK)
+        ],
+        use_query_cache=True,
+    )
+    rows = get_bigquery_client().query(UNDERCUT_SIGNALS_SQL, job_config=job_config).result()
+    return [dict(row.items()) for row in rows]
+
+
+class UndercutSignalFinder(BaseAgent):
+    """Runs the undercut query directly and saves the rows to 'undercut_signals'."""
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        signals = json.dumps(await asyncio.to_thread(fetch_undercut_signals), default=str)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=_signals_summary(signals),
+            actions=EventActions(state_delta={"undercut_signals": signals}),
+        )
+
+
+data_finder = UndercutSignalFinder(
     name="DataFinder",
-    model="gemini-2.5-flash",
     description=f"Finds instances where competitors are undercutting our products by checking the market_signals and products tables in retail_db dataset in the project {CLOUD_PROJECT_ID}.",
-    instruction=f"""\
-        You are a data analyst. Use the BigQuery tool to identify products where a competitor's price is lower than our product's cost price.
-        Specifically: 
-        1. Join the 'products' table (columns: product_id, name, cost_price) and 'market_signals' table (columns: product_id, competitor_name, detected_price).
-        2. Filter for recent signals where 'detected_price' in 'market_signals' is LESS THAN 'cost_price' in 'products'.
-        3. Present the output as a clean, simple JSON list containing the following details for each matching product: 
-           our **product_id**, our **name**, our **cost_price**, the **competitor_name**, and the **detected_price**.
-        4. If no such products are found, output an empty JSON list: [].
-        SAVE THE JSON OUTPUT TO THE STATE KEY: 'undercut_signals'
-    """,
-    tools=[bigquery_read_toolset],
-    output_key="undercut_signals" # Saves the JSON list of undercutting events
+    before_agent_callback=_serve_cached_signals,
+    after_agent_callback=_store_signals
 )
 
-cmo_agent = LlmAgent(
-    name="CMOAgent",
-    model="gemini-2.5-flash",
-    description="The Chief Marketing Officer agent provides a promotional strategy in response to competitor undercutting.",
-    instruction="""\
-        The following competitor undercutting signals were detected: {undercut_signals}.
-        Based on this, propose a high-level **Marketing Decision (cmo_proposal)** to counter the pricing threat. 
-        Your decision must be a concise strategy (e.g., 'Launch a defensive pricing match campaign').
-        SAVE THE MARKETING DECISION TEXT TO THE STATE KEY: 'cmo_proposal'
-    """,
-    output_key="cmo_proposal" 
-)
 
-cfo_agent = LlmAgent(
-    name="CFOAgent",
-    model="gemini-2.5-flash",
-    description="The Chief Financial Officer agent analyzes the financial impact of undercutting and proposes a price-related countermeasure.",
-    instruction="""\
-        The competitor undercutting signals are: {undercut_signals}. 
-        The CMO's proposal is: {cmo_proposal}. 
-        Based on this, propose a **Financial Decision (cfo_rebuttal)**, focusing on profitability and budget allocation (e.g., 'Approve a temporary 10% margin reduction budget' or 'Source cheaper supplier').
-        SAVE THE FINANCIAL DECISION AND ANALYSIS TO THE STATE KEY: 'cfo_rebuttal'
-    """,
-    output_key="cfo_rebuttal" 
-)
+# Every downstream LlmAgent needs the same (potentially long) signals list. It
+# is stored once as Gemini cached content and referenced by name. Names are
+# kept per worker process and keyed by model and signals, so every run within
+# the TTL (DataFinder serves the same signals all hour) reuses one cache.
+SIGNALS_CACHE_TTL_SECONDS = 600
+# Gemini rejects caches below its minimum prompt size (1024 tokens for 2.5
+# Flash); shorter signal lists are simply inlined into the instruction.
+SIGNALS_CACHE_MIN_CHARS = 4096
+_signals_cache_names: dict[str, tuple[float, str]] = {}
+
+
+@functools.lru_cache(maxsize=1)
+def get_genai_client() -> genai.Client:
+    return genai.Client()
+
+
+async def _signals_cache_name(model: str, signals: str) -> Optional[str]:
+    """Returns the cached content name for these signals, creating it if needed."""
+    if len(signals) < SIGNALS_CACHE_MIN_CHARS:
+        return None
+    signals_key = hashlib.sha256((model + signals).encode()).hexdigest()
+    now = time.monotonic()
+    cached = _signals_cache_names.get(signals_key)
+    # Leave a margin so a cache doesn't expire between lookup and model call.
+    if cached is not None and cached[0] > now + 60:
+        return cached[1] or None
+
+    name = ""
+    try:
+        cached_content = await get_genai_client().aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[types.Content(
+                    role="user",
+                    parts=[types.Part(text=f"The competitor undercutting signals are: {signals}")],
+                )],
+                ttl=f"{SIGNALS_CACHE_TTL_SECONDS}s",
+            ),
+        )
+        name = cached_content.name
+    except Exception:
+        logger.warning("Could not cache undercut signals; sending them inline.", exc_info=True)
+    for key in [k for k, (expires_at, _) in _signals_cache_names.items() if expires_at < now]:
+        del _signals_cache_names[key]
+    # A failed creation is remembered too, so runs don't retry it on every call.
+    _signals_cache_names[signals_key] = (now + SIGNALS_CACHE_TTL_SECONDS, name)
+    return name or None
+
+
+async def _attach_signals_context(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    signals = str(callback_context.state.get("undercut_signals", ""))
+    cache_name = await _signals_cache_name(llm_request.model, signals)
+    if not cache_name:
+        llm_request.append_instructions([f"The competitor undercutting signals are: {signals}"])
+        return None
+    llm_request.config.cached_content = cache_name
+    # Gemini doesn't accept a system_instruction alongside cached content, so
+    # the agent's instruction is sent as the leading user turn instead.
+    if llm_request.config.system_instruction:
+        llm_request.contents.insert(0, types.Content(
+            role="user", parts=[types.Part(text=str(llm_request.config.system_instruction))]
+        ))
+        llm_request.config.system_instruction = None
+    return None
+
+
+# Instruction templates are split into literals and state keys once at import,
+# so each model call just joins the parts instead of re-parsing the template.
+# ADK skips its own state injection for callable instructions, so the parser
+# follows ADK's placeholder grammar: {key}, optional {key?}, and app:/user:/temp:
+# prefixed keys. Anything else in braces stays literal text, as it does in ADK.
+_STATE_PLACEHOLDER = re.compile(r"(?<![\$\{\\]){+[^{}]*}+")
+_STATE_PREFIXES = (State.APP_PREFIX, State.USER_PREFIX, State.TEMP_PREFIX)
+
+
+def _is_state_key(name: str) -> bool:
+    prefix, _, key = name.rpartition(":")
+    if not prefix:
+        return name.isidentifier()
+    return prefix + ":" in _STATE_PREFIXES and key.isidentifier()
 
-ops_agent = LlmAgent(
-    name="OpsAgent",
+
+def _compile_instruction(template: str) -> Callable[[ReadonlyContext], str]:
+    """Pre-parses an instruction template into an ADK instruction provider.
+
+    Raises:
+        ValueError: If the template uses {artifact.*} placeholders, which need
+            ADK's async artifact loading.
+    """
+    literals, keys = [], []
+    last_end = 0
+    for match in _STATE_PLACEHOLDER.finditer(template):
+        name = match.group().lstrip("{").rstrip("}").strip()
+        optional = name.endswith("?")
+        name = name.removesuffix("?")
+        if name.startswith("artifact."):
+            raise ValueError(f"Artifact placeholders aren't supported in compiled instructions: {match.group()}")
+        if not _is_state_key(name):
+            continue
+        literals.append(template[last_end:match.start()])
+        keys.append((name, optional))
+        last_end = match.end()
+    literals.append(template[last_end:])
+
+    def instruction_provider(context: ReadonlyContext) -> str:
+        state = context.state
+        parts = [literals[0]]
+        for (key, optional), literal in zip(keys, literals[1:]):
+            if key in state:
+                value = state[key]
+                parts.append("" if value is None else str(value))
+            elif optional:
+                parts.append("")
+            else:
+                raise KeyError(f"Context variable not found: `{key}` in agent '{context.agent_name}'.")
+            parts.append(literal)
+        return "".join(parts)
+
+    return instruction_provider
+
+
+class CouncilOutput(BaseModel):
+    """Structured output of the executive council (CMO, CFO and Ops in one call)."""
+    cmo_proposal: str = Field(description="The CMO's marketing decision to counter the pricing threat.")
+    cfo_rebuttal: str = Field(description="The CFO's financial decision and analysis.")
+    ops_input: str = Field(description="The Ops input on feasibility, stock readiness and potential delays.")
+
+
+def _unpack_council(callback_context: CallbackContext) -> Optional[types.Content]:
+    # Expose each role under its own state key so downstream agents can keep
+    # referencing {cmo_proposal}, {cfo_rebuttal} and {ops_input} directly.
+    council = callback_context.state.get("council") or {}
+    for key in CouncilOutput.model_fields:
+        callback_context.state[key] = council.get(key, "")
+    return None
+
+
+# CMO, CFO and Ops share the same context, so a single structured call replaces
+# three separate round-trips.
+COUNCIL_INSTRUCTION_TEMPLATE = """\
+        Competitor undercutting signals were detected (provided in the context).
+        Act as the executive council and answer from each of the following three perspectives:
+        1. **Chief Marketing Officer (cmo_proposal):** propose a high-level marketing decision to counter the pricing threat.
+           It must be a concise strategy (e.g., 'Launch a defensive pricing match campaign').
+        2. **Chief Financial Officer (cfo_rebuttal):** propose a financial decision, focusing on profitability and budget allocation
+           (e.g., 'Approve a temporary 10% margin reduction budget' or 'Source cheaper supplier').
+        3. **Operations (ops_input):** provide concise input on feasibility, stock readiness (current_stock from the products table
+           in retail_db dataset in the project "cr-ai-nov-2025" is available for context), and potential delays.
+        Output a JSON object with the keys "cmo_proposal", "cfo_rebuttal" and "ops_input".
+    """
+COUNCIL_INSTRUCTION = _compile_instruction(COUNCIL_INSTRUCTION_TEMPLATE)
+
+council_agent = LlmAgent(
+    name="ExecCouncil",
     model="gemini-2.5-flash",
-    description="The Operations Agent provides input on logistics and inventory related to the pricing threat and proposed decisions.",
-    instruction="""\
-        The competitor undercutting signals are: {undercut_signals}. 
-        The CMO proposes: {cmo_proposal}. The CFO proposes: {cfo_rebuttal}.
-        Provide a concise **Operational Input (ops_input)** on feasibility, stock readiness (current_stock from the products table in retail_db dataset in the project "cr-ai-nov-2025" is available for context), and potential delays. 
-        SAVE THE OPERATIONAL INPUT TEXT TO THE STATE KEY: 'ops_input'
-    """,
-    output_key="ops_input" 
+    description="The executive council (CMO, CFO and Ops) responds to competitor undercutting in a single structured decision.",
+    instruction=COUNCIL_INSTRUCTION,
+    output_schema=CouncilOutput,
+    output_key="council",
+    # Everything the council needs comes from state or the signals cache.
+    include_contents="none",
+    before_model_callback=_attach_signals_context,
+    after_agent_callback=_unpack_council
 )
 
-ceo_agent = LlmAgent(
-    name="CEOAgent",
-    model="gemini-2.5-flash",
-    description="The Chief Executive Officer agent reviews all inputs and delivers the final, validated verdict.",
-    instruction="""\
+CEO_INSTRUCTION_TEMPLATE = """\
         Review the following inputs:
-        1. Undercut Products/Signals: {undercut_signals}
+        1. Undercut Products/Signals: provided in the context
         2. CMO Proposal: {cmo_proposal}
         3. CFO Rebuttal: {cfo_rebuttal}
         4. Ops Input: {ops_input}
@@ -102,50 +338,306 @@ ceo_agent = LlmAgent(
         Synthesize these into a single, cohesive **Final Verdict (ceo_verdict)** and set a **status** (e.g., 'APPROVED', 'DEFERRED', 'REJECTED').
         The output must be a clean JSON object with two keys: "verdict" and "status".
         SAVE THE JSON OBJECT TO THE STATE KEY: 'ceo_decision_json'
-    """,
-    output_key="ceo_decision_json" 
+    """
+CEO_INSTRUCTION = _compile_instruction(CEO_INSTRUCTION_TEMPLATE)
+
+ceo_agent = LlmAgent(
+    name="CEOAgent",
+    model="gemini-2.5-flash",
+    description="The Chief Executive Officer agent reviews all inputs and delivers the final, validated verdict.",
+    instruction=CEO_INSTRUCTION,
+    output_key="ceo_decision_json",
+    include_contents="none",
+    before_model_callback=_attach_signals_context
+)
+
+# Logging has no creative content, so it is a plain Python agent rather than an
+# LLM call. Rows are handed to a background buffer (fire-and-forget).
+#
+# Identical (signals, verdict) pairs (e.g. retries or replays) are deduplicated
+# in two ways, and neither is a global guarantee:
+# - _logged_debates skips repeats for 24 hours, but only within one worker
+#   process. Other uvicorn workers or Cloud Run instances keep their own dicts.
+# - The dedup key is also sent as the BigQuery insertId. BigQuery drops repeats
+#   across all workers, but only best-effort and for about a minute.
+COUNCIL_DEBATES_TABLE = f"{CLOUD_PROJECT_ID}.{DEFAULT_DATASET_ID}.council_debates"
+DEBATE_DEDUP_TTL_SECONDS = 24 * 3600
+COUNCIL_DEBATES_BATCH_SIZE = 500
+COUNCIL_DEBATES_FLUSH_INTERVAL_SECONDS = 5.0
+_logged_debates: dict[str, float] = {}
+
+
+def _parse_ceo_decision(ceo_decision_json: str) -> dict:
+    """Returns the CEO's {"verdict", "status"}, keeping non-JSON output as the verdict."""
+    ceo_decision = _parse_json_output(ceo_decision_json)
+    if not isinstance(ceo_decision, dict):
+        ceo_decision = {"verdict": ceo_decision_json, "status": None}
+    return ceo_decision
+
+
+class CouncilDebatesBuffer:
+    """Buffers council_debates rows and streams them to BigQuery in batches.
+
+    Rows are flushed every ``flush_interval`` seconds or once ``batch_size``
+    rows are pending, so many runs share one insertAll round-trip instead of
+    paying for a request each.
+    """
+
+    def __init__(self, table: str, batch_size: int, flush_interval: float):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._row_added: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: list = []
+
+    def put(self, debate_key: str, row: dict) -> None:
+        """Queues a row; must be called from the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            pending = self._take_pending()
+            self._queue = asyncio.Queue()
+            self._row_added = asyncio.Event()
+            for item in pending:
+                self._queue.put_nowait(item)
+            self._loop = loop
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._drain())
+        self._queue.put_nowait((debate_key, row))
+        self._row_added.set()
+
+    async def aclose(self) -> None:
+        """Stops the drain task and writes every buffered row (call on shutdown)."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(self.flush_pending)
+
+    def flush_pending(self) -> None:
+        """Synchronously writes the in-flight batch and everything still queued."""
+        pending = self._take_pending()
+        for start in range(0, len(pending), self.batch_size):
+            self._release(self._insert(pending[start:start + self.batch_size]))
+
+    def _take_pending(self) -> list:
+        pending, self._in_flight = self._in_flight, []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        return pending
+
+    async def _drain(self) -> None:
+        # Cancellation (loop shutdown) leaves _in_flight and the queue intact;
+        # aclose() or the atexit hook writes them off the event loop.
+        loop = asyncio.get_running_loop()
+        while True:
+            # Rows being collected stay on self._in_flight rather than in a
+            # local, so a shutdown mid-batch can still write them.
+            self._in_flight.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+            while True:
+                while len(self._in_flight) < self.batch_size and not self._queue.empty():
+                    self._in_flight.append(self._queue.get_nowait())
+                timeout = deadline - loop.time()
+                if len(self._in_flight) >= self.batch_size or timeout <= 0:
+                    break
+                # asyncio.wait (unlike wait_for on Python 3.10/3.11) never
+                # swallows a cancellation of this task.
+                self._row_added.clear()
+                waiter = loop.create_task(self._row_added.wait())
+                try:
+                    await asyncio.wait({waiter}, timeout=timeout)
+                finally:
+                    waiter.cancel()
+            batch, self._in_flight = self._in_flight, []
+            failed_keys = await asyncio.to_thread(self._insert, batch)
+            self._release(failed_keys)
+
+    def _insert(self, batch: list) -> list:
+        """Inserts a batch and returns the dedup keys of the rows that failed."""
+        try:
+            errors = get_bigquery_client().insert_rows_json(
+                self.table,
+                [row for _, row in batch],
+                row_ids=[debate_key for debate_key, _ in batch],
+            )
+        except Exception:
+            logger.exception("Failed to log %d council debates to %s", len(batch), self.table)
+            return [debate_key for debate_key, _ in batch]
+        if errors:
+            logger.error("Rejected council debate rows for %s: %s", self.table, errors)
+        return [batch[error["index"]][0] for error in errors]
+
+    @staticmethod
+    def _release(failed_keys: list) -> None:
+        # Forget failed rows so a replay of the same debate can log them.
+        for debate_key in failed_keys:
+            _logged_debates.pop(debate_key, None)
+
+
+council_debates_buffer = CouncilDebatesBuffer(
+    COUNCIL_DEBATES_TABLE,
+    batch_size=COUNCIL_DEBATES_BATCH_SIZE,
+    flush_interval=COUNCIL_DEBATES_FLUSH_INTERVAL_SECONDS,
 )
+# app.py flushes on lifespan shutdown; atexit covers runs outside the server.
+atexit.register(council_debates_buffer.flush_pending)
+
 
-log_agent = LlmAgent(
+class CouncilDebatesLogger(BaseAgent):
+    """Writes the council debate to the council_debates table without an LLM call."""
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        signals = str(state.get("undercut_signals", ""))
+        ceo_decision_json = str(state.get("ceo_decision_json", ""))
+
+        debate_key = hashlib.sha256((signals + ceo_decision_json).encode()).hexdigest()
+        now = time.monotonic()
+        for key in [k for k, expires_at in _logged_debates.items() if expires_at < now]:
+            del _logged_debates[key]
+        if debate_key in _logged_debates:
+            return
+
+        ceo_decision = _parse_ceo_decision(ceo_decision_json)
+        parsed_signals = _parse_json_output(signals)
+        row = {
+            "debate_id": str(uuid.uuid4()),
+            "product_signals": json.dumps(parsed_signals) if parsed_signals is not None else signals,
+            "cmo_proposal": state.get("cmo_proposal", ""),
+            "cfo_rebuttal": state.get("cfo_rebuttal", ""),
+            "ops_input": state.get("ops_input", ""),
+            "ceo_verdict": ceo_decision.get("verdict"),
+            "decision_status": ceo_decision.get("status"),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        # Claim the key up front so concurrent replays don't both write; the
+        # buffer releases it again if the batch insert fails.
+        _logged_debates[debate_key] = now + DEBATE_DEDUP_TTL_SECONDS
+        council_debates_buffer.put(debate_key, row)
+        # Side effects only; the FinalReporter produces the user-facing output.
+        return
+        yield
+
+
+log_agent = CouncilDebatesLogger(
     name="CouncilDebatesLogger",
-    model="gemini-2.5-flash",
-    description=f"Agent responsible for logging the final, multi-agent executive decision into the 'council_debates' BigQuery table in retail_db dataset in the project {CLOUD_PROJECT_ID}.",
-    instruction=f"""\
-        The multi-agent inputs are:
-        - Product Signals: {{undercut_signals}}
-        - CMO Proposal: {{cmo_proposal}}
-        - CFO Rebuttal: {{cfo_rebuttal}}
-        - Ops Input: {{ops_input}}
-        - CEO Final Decision (JSON): {{ceo_decision_json}}
-
-        **PERFORM THE INSERT OPERATION ONLY.** This step is for logging and should not generate text output for the user.
-        
-        ... (BigQuery INSERT logic as before) ...
-    """,
-    tools=[bigquery_write_toolset],
-    # The log agent is primarily for side effects (writing data), not direct output
-    # We will let the next agent handle the final user-facing output.
+    description=f"Logs the final, multi-agent executive decision into the 'council_debates' BigQuery table in retail_db dataset in the project {CLOUD_PROJECT_ID}.",
 )
 
-## 2.6. Final Reporting Agent (NEW STEP)
-final_reporter = LlmAgent(
+## 2.6. Final Reporting Agent
+# The report only interpolates state keys, so it is rendered from a template
+# instead of spending a Gemini call on string formatting.
+REPORT_TEMPLATE = """\
+# Executive Decision Report
+
+## Undercut Products Detected
+{undercut_products}
+
+## Marketing Strategy (CMO)
+{cmo_proposal}
+
+## Financial Analysis (CFO)
+{cfo_rebuttal}
+
+## Operational Assessment (Ops)
+{ops_input}
+
+## CEO Final Decision
+**Status:** {decision_status}
+**Verdict:** {ceo_verdict}
+"""
+
+
+def _format_undercut_products(raw_signals) -> str:
+    signals = _parse_json_output(raw_signals)
+    if not isinstance(signals, list):
+        return str(raw_signals)
+    return "\n".join(
+        f"- **{signal.get('product_id')}: {signal.get('name')}**\n"
+        f"  - Our cost: {signal.get('cost_price')}\n"
+        f"  - {signal.get('competitor_name')} price: {signal.get('detected_price')}"
+        for signal in signals
+        if isinstance(signal, dict)
+    )
+
+
+class FinalReporter(BaseAgent):
+    """Renders the workflow's state keys into the markdown REPORT_TEMPLATE."""
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        ceo_decision = _parse_ceo_decision(str(state.get("ceo_decision_json", "")))
+        report = REPORT_TEMPLATE.format(
+            undercut_products=_format_undercut_products(state.get("undercut_signals", "")),
+            cmo_proposal=state.get("cmo_proposal", ""),
+            cfo_rebuttal=state.get("cfo_rebuttal", ""),
+            ops_input=state.get("ops_input", ""),
+            decision_status=ceo_decision.get("status"),
+            ceo_verdict=ceo_decision.get("verdict"),
+        )
+        # This is the last agent, so its event is the workflow's final response.
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=report)]),
+        )
+
+
+final_reporter = FinalReporter(
     name="FinalReporter",
-    model="gemini-2.5-flash",
     description="Summarizes the entire executive workflow output for the user.",
-    instruction="""\
-        Generate a final report based on the workflow's state keys. Start with the list of undercut products, followed by the executive proposals.
-        
-        **Undercut Products (undercut_signals):** {undercut_signals}
-        **CMO Proposal (cmo_proposal):** {cmo_proposal}
-        **CFO Rebuttal (cfo_rebuttal):** {cfo_rebuttal}
-        **Ops Input (ops_input):** {ops_input}
-        **CEO Final Decision (ceo_decision_json):** {ceo_decision_json}
-
-        Format the entire response as a single, clean, markdown-formatted report.
-    """,
-    # This agent's output is what the SequentialAgent will ultimately return
-    # if it's the last agent in the list. No explicit output_key needed if 
-    # the LlmAgent is the last one and its response is the final response.
+)
+
+
+NO_UNDERCUTTING_MESSAGE = "No undercutting detected today."
+
+
+class NoSignalGuard(SequentialAgent):
+    """Runs its sub-agents in order only when DataFinder found undercut products.
+
+    On an empty signal list it answers with NO_UNDERCUTTING_MESSAGE instead,
+    so the null path costs no LLM calls and no BigQuery writes.
+    """
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        raw_signals = ctx.session.state.get("undercut_signals")
+        signals = _parse_json_output(raw_signals)
+        # Output that isn't valid JSON is passed on rather than treated as empty.
+        if signals or (signals is None and str(raw_signals or "").strip()):
+            async for event in super()._run_async_impl(ctx):
+                yield event
+            return
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(
+                role="model", parts=[types.Part(text=NO_UNDERCUTTING_MESSAGE)]
+            ),
+        )
+
+
+no_signal_guard = NoSignalGuard(
+    name="NoSignalGuard",
+    description="Runs the executive council, CEO, logger and reporter only when there are undercutting signals to act on.",
+    sub_agents=[
+        council_agent, 
+        ceo_agent, 
+        log_agent, 
+        final_reporter 
+    ]
 )
 
 
@@ -153,14 +645,9 @@ final_reporter = LlmAgent(
 # Added the FinalReporter agent to the end
 root_agent = SequentialAgent(
     name="ExecutiveDecisionWorkflow_V2",
-    description="Orchestrates data finding, executive decision-making (CMO, CFO, Ops, CEO), and final logging based on competitor signals.",
+    description="Orchestrates data finding, executive decision-making (CMO, CFO, Ops council, CEO), and final logging based on competitor signals.",
     sub_agents=[
         data_finder, 
-        cmo_agent, 
-        cfo_agent, 
-        ops_agent, 
-        ceo_agent, 
-        log_agent, 
-        final_reporter 
+        no_signal_guard 
     ]
 )
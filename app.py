@@ -1,9 +1,12 @@
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from google.adk.cli.fast_api import get_fast_api_app
 
+from agent.agent import council_debates_buffer, get_bigquery_client, get_credentials
+
 # Load .env variables if any
 load_dotenv()
 
@@ -23,6 +26,25 @@ app.title = "Executive Decision Workflow - ADK"
 app.description = "Multi-agent workflow orchestrated via ADK"
 app.version = "1.0.0"
 
+# Prewarm credentials and the BigQuery client in each worker at startup so the
+# first request doesn't pay for ADC discovery, and flush buffered debate logs on
+# shutdown. ADK installs its own lifespan, which would suppress
+# @app.on_event("startup") handlers, so wrap it instead.
+_adk_lifespan = app.router.lifespan_context
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.creds = get_credentials()
+    app.state.bigquery_client = get_bigquery_client()
+    try:
+        async with _adk_lifespan(app) as state:
+            yield state
+    finally:
+        # Write any buffered council_debates rows before the worker exits.
+        await council_debates_buffer.aclose()
+
+app.router.lifespan_context = lifespan
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "executive-decision-workflow"}
@@ -35,7 +57,3 @@ def root():
         "docs": "/docs",
         "health": "/health"
     }
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080, log_level="info")
@@ -0,0 +1,37 @@
+"""Starts the multi-worker uvicorn server for app:app.
+
+This launcher deliberately doesn't import app.py: the uvicorn supervisor
+process only spawns workers, and each worker imports the app (ADK, genai,
+BigQuery) itself. Running app.py directly would load a full copy in the
+supervisor that never serves a request.
+"""
+import os
+
+import uvicorn
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on; os.cpu_count() reports the whole host."""
+    if hasattr(os, "process_cpu_count"):  # Python 3.13+
+        return os.process_cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+if __name__ == "__main__":
+    # The workload is I/O bound (BigQuery + Gemini), so scale with one worker
+    # per core on uvloop/httptools. Workers need the app as an import string.
+    # CPU affinity still doesn't reflect a container's CPU quota, so containers
+    # should set WEB_CONCURRENCY explicitly (the Dockerfile does).
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8080")),
+        workers=int(os.getenv("WEB_CONCURRENCY", available_cpus())),
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=75,
+        limit_concurrency=1024,
+        log_level="info"
+    )
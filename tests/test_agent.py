@@ -0,0 +1,283 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.sessions import InMemorySessionService
+from google.adk.utils.instructions_utils import inject_session_state
+from google.genai import types
+
+from agent import agent
+
+
+def _run_workflow(
+    message: str = "Analyze competitor pricing threats", root_agent=None, state=None
+) -> list:
+    async def run() -> list:
+        runner = InMemoryRunner(agent=root_agent or agent.root_agent, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="user", state=state
+        )
+        content = types.Content(role="user", parts=[types.Part(text=message)])
+        return [
+            event
+            async for event in runner.run_async(
+                user_id="user", session_id=session.id, new_message=content
+            )
+        ]
+
+    return asyncio.run(run())
+
+
+def test_empty_signals_skip_llm_and_logging(monkeypatch):
+    model_calls = []
+    queued_rows = []
+
+    async def fake_generate_content_async(self, llm_request, stream=False):
+        model_calls.append(llm_request)
+        raise AssertionError("no model call expected for empty signals")
+        yield
+
+    monkeypatch.setattr(Gemini, "generate_content_async", fake_generate_content_async)
+    monkeypatch.setattr(agent, "fetch_undercut_signals", lambda: [])
+    monkeypatch.setattr(agent, "_undercut_signals_cache", {})
+    monkeypatch.setattr(agent.council_debates_buffer, "put", lambda *args: queued_rows.append(args))
+
+    events = _run_workflow()
+
+    assert model_calls == []
+    assert queued_rows == []
+    assert [event.author for event in events] == ["DataFinder", "NoSignalGuard"]
+    assert events[-1].content.parts[0].text == agent.NO_UNDERCUTTING_MESSAGE
+
+
+SIGNALS = [
+    {
+        "product_id": f"PROD-{index}",
+        "name": f"Product {index}",
+        "cost_price": 45.0,
+        "competitor_name": "TechRival Inc.",
+        "detected_price": 39.99,
+    }
+    for index in range(60)
+]
+
+
+def _stub_workflow(monkeypatch, signals=SIGNALS) -> SimpleNamespace:
+    """Stubs Gemini, the genai cache, BigQuery and the log buffer; records calls."""
+    calls = SimpleNamespace(llm_requests=[], cache_creates=[], fetches=0, queued_rows=[])
+
+    async def fake_generate_content_async(self, llm_request, stream=False):
+        calls.llm_requests.append(llm_request)
+        if llm_request.config.response_schema is not None:
+            text = json.dumps({"cmo_proposal": "Bundle", "cfo_rebuttal": "Budget", "ops_input": "In stock"})
+        else:
+            text = json.dumps({"verdict": "Proceed with bundling", "status": "APPROVED"})
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+    async def fake_create_cache(model, config):
+        calls.cache_creates.append(model)
+        return SimpleNamespace(name=f"cachedContents/signals-{len(calls.cache_creates)}")
+
+    def fake_fetch_undercut_signals():
+        calls.fetches += 1
+        return signals
+
+    genai_client = SimpleNamespace(aio=SimpleNamespace(caches=SimpleNamespace(create=fake_create_cache)))
+    monkeypatch.setattr(Gemini, "generate_content_async", fake_generate_content_async)
+    monkeypatch.setattr(agent, "get_genai_client", lambda: genai_client)
+    monkeypatch.setattr(agent, "fetch_undercut_signals", fake_fetch_undercut_signals)
+    monkeypatch.setattr(agent, "_undercut_signals_cache", {})
+    monkeypatch.setattr(agent, "_signals_cache_names", {})
+    monkeypatch.setattr(agent, "_logged_debates", {})
+    monkeypatch.setattr(agent.council_debates_buffer, "put", lambda *args: calls.queued_rows.append(args))
+    return calls
+
+
+def test_signals_are_sent_only_through_the_context_cache(monkeypatch):
+    calls = _stub_workflow(monkeypatch)
+
+    events = _run_workflow()
+
+    assert len(calls.llm_requests) == 2
+    for llm_request in calls.llm_requests:
+        assert llm_request.config.cached_content == "cachedContents/signals-1"
+        contents = json.dumps([content.model_dump(mode="json") for content in llm_request.contents])
+        assert "PROD-0" not in contents
+    assert len(calls.queued_rows) == 1
+    assert events[-1].author == "FinalReporter"
+    assert "**Status:** APPROVED" in events[-1].content.parts[0].text
+
+
+def test_sessions_with_the_same_signals_share_one_context_cache(monkeypatch):
+    calls = _stub_workflow(monkeypatch)
+
+    _run_workflow()
+    _run_workflow()
+
+    assert len(calls.cache_creates) == 1
+    assert len(calls.llm_requests) == 4
+    assert {request.config.cached_content for request in calls.llm_requests} == {"cachedContents/signals-1"}
+
+
+def test_cached_signals_skip_bigquery_and_still_reach_the_report(monkeypatch):
+    calls = _stub_workflow(monkeypatch)
+
+    _run_workflow()
+    events = _run_workflow()
+
+    assert calls.fetches == 1
+    assert [event.author for event in events if event.content] == [
+        "DataFinder", "ExecCouncil", "CEOAgent", "FinalReporter"
+    ]
+    assert "PROD-0" in events[-1].content.parts[0].text
+    assert len(calls.llm_requests) == 4
+
+
+class _FakeBigQueryClient:
+    def __init__(self):
+        self.rows = []
+
+    def insert_rows_json(self, table, rows, row_ids=None):
+        self.rows.extend(rows)
+        return []
+
+
+def test_flush_pending_writes_rows_left_by_a_loop_shutdown(monkeypatch):
+    client = _FakeBigQueryClient()
+    monkeypatch.setattr(agent, "get_bigquery_client", lambda: client)
+    buffer = agent.CouncilDebatesBuffer("table", batch_size=500, flush_interval=5.0)
+
+    async def log_rows():
+        for index in range(3):
+            buffer.put(f"key-{index}", {"debate_id": str(index)})
+        await asyncio.sleep(0)
+
+    asyncio.run(log_rows())
+    # Cancelling the drain task must not write on the (closing) event loop.
+    assert client.rows == []
+
+    buffer.flush_pending()
+
+    assert [row["debate_id"] for row in client.rows] == ["0", "1", "2"]
+
+
+def test_aclose_writes_in_flight_and_queued_rows(monkeypatch):
+    client = _FakeBigQueryClient()
+    monkeypatch.setattr(agent, "get_bigquery_client", lambda: client)
+    buffer = agent.CouncilDebatesBuffer("table", batch_size=500, flush_interval=5.0)
+
+    async def log_rows_and_close():
+        buffer.put("key-0", {"debate_id": "0"})
+        await asyncio.sleep(0)
+        buffer.put("key-1", {"debate_id": "1"})
+        await buffer.aclose()
+
+    asyncio.run(log_rows_and_close())
+
+    assert sorted(row["debate_id"] for row in client.rows) == ["0", "1"]
+
+
+class _FailingBigQueryClient:
+    def __init__(self, errors=None):
+        self.errors = errors
+
+    def insert_rows_json(self, table, rows, row_ids=None):
+        if self.errors is None:
+            raise ConnectionError("BigQuery unavailable")
+        return self.errors
+
+
+def _debate_state(status="APPROVED") -> dict:
+    return {
+        "undercut_signals": json.dumps(SIGNALS[:1]),
+        "cmo_proposal": "Bundle",
+        "cfo_rebuttal": "Budget",
+        "ops_input": "In stock",
+        "ceo_decision_json": json.dumps({"verdict": "Proceed", "status": status}),
+    }
+
+
+def test_logger_writes_an_identical_debate_once(monkeypatch):
+    queued_rows = []
+    monkeypatch.setattr(agent, "_logged_debates", {})
+    monkeypatch.setattr(agent.council_debates_buffer, "put", lambda *args: queued_rows.append(args))
+    logger = agent.CouncilDebatesLogger(name="CouncilDebatesLogger")
+
+    _run_workflow(root_agent=logger, state=_debate_state())
+    _run_workflow(root_agent=logger, state=_debate_state())
+    _run_workflow(root_agent=logger, state=_debate_state(status="DEFERRED"))
+
+    assert len(queued_rows) == 2
+    debate_key, row = queued_rows[0]
+    assert debate_key in agent._logged_debates
+    assert row["ceo_verdict"] == "Proceed"
+    assert row["decision_status"] == "APPROVED"
+    assert json.loads(row["product_signals"]) == SIGNALS[:1]
+
+
+def test_failed_inserts_release_their_dedup_keys(monkeypatch):
+    monkeypatch.setattr(agent, "_logged_debates", {"key-0": float("inf"), "key-1": float("inf")})
+    buffer = agent.CouncilDebatesBuffer("table", batch_size=500, flush_interval=5.0)
+    batch = [("key-0", {"debate_id": "0"}), ("key-1", {"debate_id": "1"})]
+
+    monkeypatch.setattr(
+        agent, "get_bigquery_client",
+        lambda: _FailingBigQueryClient(errors=[{"index": 1, "errors": ["invalid"]}]),
+    )
+    buffer._release(buffer._insert(batch))
+    assert list(agent._logged_debates) == ["key-0"]
+
+    monkeypatch.setattr(agent, "get_bigquery_client", lambda: _FailingBigQueryClient())
+    buffer._release(buffer._insert(batch))
+    assert agent._logged_debates == {}
+
+
+def _readonly_context(state: dict) -> ReadonlyContext:
+    async def create_session():
+        return await session_service.create_session(app_name="test", user_id="user", state=state)
+
+    session_service = InMemorySessionService()
+    session = asyncio.run(create_session())
+    return ReadonlyContext(InvocationContext(
+        session_service=session_service,
+        invocation_id="invocation",
+        agent=agent.ceo_agent,
+        session=session,
+    ))
+
+
+def test_compiled_instructions_render_like_adk_state_injection():
+    template = (
+        "CMO: {cmo_proposal}, CFO: { cfo_rebuttal }, Ops: {ops_input}, "
+        "missing: {notes?}, empty: {ceo_decision_json}, app: {app:region}, "
+        "user: {user:tier?}, literal: {not a key} {{council}} ${escaped}"
+    )
+    state = {
+        "cmo_proposal": "Bundle",
+        "cfo_rebuttal": "Budget",
+        "ops_input": "In stock",
+        "ceo_decision_json": None,
+        "council": {"cmo_proposal": "Bundle"},
+        "app:region": "EU",
+    }
+    context = _readonly_context(state)
+
+    for compiled, raw in [
+        (agent.COUNCIL_INSTRUCTION, agent.COUNCIL_INSTRUCTION_TEMPLATE),
+        (agent.CEO_INSTRUCTION, agent.CEO_INSTRUCTION_TEMPLATE),
+        (agent._compile_instruction(template), template),
+    ]:
+        assert compiled(context) == asyncio.run(inject_session_state(raw, context))
+
+
+def test_compiled_instructions_reject_missing_keys_and_artifacts():
+    with pytest.raises(KeyError):
+        agent._compile_instruction("{cmo_proposal}")(_readonly_context({}))
+    with pytest.raises(ValueError):
+        agent._compile_instruction("{artifact.report}")